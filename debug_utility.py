@@ -1,6 +1,9 @@
 import sys
+import traceback
+from collections import Counter
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QPushButton, QTextEdit, QWidget, QLabel
 from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QTextCursor
 
 # Import the necessary modules from the project
 from models.parser import ProcessAlgebraParser
@@ -27,6 +30,7 @@ class DebugWindow(QMainWindow):
         # Add debug output area
         self.debug_output = QTextEdit()
         self.debug_output.setReadOnly(True)
+        self._log_buf = []
         layout.addWidget(QLabel("<b>Debug Output</b>"))
         layout.addWidget(self.debug_output)
         
@@ -53,10 +57,22 @@ class DebugWindow(QMainWindow):
         # Show parser and scene status
         self.log_debug("Debugger initialized. Parser and PetriNetWindow created.")
         self.log_debug("Use the buttons below to diagnose the visualization issue.")
+        self.flush_log()
     
     def log_debug(self, message):
-        """Add a debug message to the output area"""
-        self.debug_output.append(message)
+        """Queue a debug message for the output area"""
+        self._log_buf.append(message)
+    
+    def flush_log(self):
+        """Write all queued debug messages to the output area in one update"""
+        if not self._log_buf:
+            return
+        text = '\n'.join(self._log_buf)
+        if not self.debug_output.document().isEmpty():
+            text = '\n' + text
+        self.debug_output.moveCursor(QTextCursor.End)
+        self.debug_output.insertPlainText(text)
+        self._log_buf.clear()
     
     def parse_test_expression(self):
         """Parse the test expression and log results"""
@@ -83,58 +99,52 @@ class DebugWindow(QMainWindow):
                 self.log_debug(f"  - Arc: {a['source_id']} → {a['target_id']} ({direction})")
         else:
             self.log_debug("❌ Parsing failed")
+        
+        self.flush_log()
     
     def visualize_test_petri_net(self):
         """Attempt to visualize the Petri net and debug the process"""
         if not self.parser.places and not self.parser.transitions:
             self.log_debug("❌ No Petri net data available. Please parse an expression first.")
+            self.flush_log()
             return
         
         self.log_debug("\n--- Visualizing Petri Net ---")
         
-        # Backup the original update_petri_net method for comparison
-        original_update = self.petri_net_window.update_petri_net
-        
-        # Create a wrapper to log what happens during visualization
-        def debug_update_petri_net(parser):
-            self.log_debug(f"update_petri_net called with parser containing:")
-            self.log_debug(f"  - {len(parser.places)} places")
-            self.log_debug(f"  - {len(parser.transitions)} transitions")
-            self.log_debug(f"  - {len(parser.arcs)} arcs")
-            
-            # Check if the PetriNetWindow has a valid scene
-            if not hasattr(self.petri_net_window, 'scene') or not self.petri_net_window.scene:
-                self.log_debug("❌ PetriNetWindow.scene is missing or invalid")
-                return
-            
-            # Log information about the scene before update
-            self.log_debug(f"Scene before update: {self.petri_net_window.scene.items().__len__()} items")
-            
-            # Call the original method
-            try:
-                original_update(parser)
-                self.log_debug("✅ update_petri_net executed without exceptions")
-            except Exception as e:
-                self.log_debug(f"❌ Exception during update_petri_net: {str(e)}")
-                import traceback
-                self.log_debug(traceback.format_exc())
-                return
-            
-            # Log information about the scene after update
-            self.log_debug(f"Scene after update: {self.petri_net_window.scene.items().__len__()} items")
-            
-        # Replace the method temporarily
-        self.petri_net_window.update_petri_net = debug_update_petri_net
-        
-        # Call the visualization method
-        self.petri_net_window.update_petri_net(self.parser)
+        # Log what happens during visualization
+        self._debug_update_petri_net(self.parser)
         
         # Show the Petri net window
         self.petri_net_window.show()
         self.petri_net_window.raise_()
+        self.flush_log()
+    
+    def _debug_update_petri_net(self, parser):
+        """Call PetriNetWindow.update_petri_net, logging the scene before and after"""
+        self.log_debug(f"update_petri_net called with parser containing:")
+        self.log_debug(f"  - {len(parser.places)} places")
+        self.log_debug(f"  - {len(parser.transitions)} transitions")
+        self.log_debug(f"  - {len(parser.arcs)} arcs")
+        
+        # Check if the PetriNetWindow has a valid scene
+        scene = getattr(self.petri_net_window, 'scene', None)
+        if not scene:
+            self.log_debug("❌ PetriNetWindow.scene is missing or invalid")
+            return
+        
+        # Log information about the scene before update
+        self.log_debug(f"Scene before update: {len(scene.items())} items")
         
-        # Restore the original method
-        self.petri_net_window.update_petri_net = original_update
+        try:
+            self.petri_net_window.update_petri_net(parser)
+            self.log_debug("✅ update_petri_net executed without exceptions")
+        except Exception as e:
+            self.log_debug(f"❌ Exception during update_petri_net: {str(e)}")
+            self.log_debug(traceback.format_exc())
+            return
+        
+        # Log information about the scene after update
+        self.log_debug(f"Scene after update: {len(scene.items())} items")
     
     def inspect_scene(self):
         """Inspect the QGraphicsScene objects to diagnose visualization issues"""
@@ -142,19 +152,24 @@ class DebugWindow(QMainWindow):
         
         if not hasattr(self.petri_net_window, 'scene') or not self.petri_net_window.scene:
             self.log_debug("❌ PetriNetWindow.scene is missing or invalid")
+            self.flush_log()
             return
         
         # Get all items in the scene
         scene_items = self.petri_net_window.scene.items()
         self.log_debug(f"Total scene items: {len(scene_items)}")
         
-        # Categorize items by type
-        item_types = {}
+        # Categorize items by type, picking out places and transitions in the same pass
+        item_types = Counter()
+        places = []
+        transitions = []
         for item in scene_items:
-            item_type = type(item).__name__
-            if item_type not in item_types:
-                item_types[item_type] = 0
-            item_types[item_type] += 1
+            item_types[type(item).__name__] += 1
+            node_type = getattr(item, 'node_type', None)
+            if node_type == 'place':
+                places.append(item)
+            elif node_type == 'transition':
+                transitions.append(item)
         
         # Log item types
         self.log_debug("Item types in scene:")
@@ -165,10 +180,7 @@ class DebugWindow(QMainWindow):
         self.log_debug(f"Scene rect: {self.petri_net_window.scene.sceneRect()}")
         self.log_debug(f"View rect: {self.petri_net_window.view.viewport().rect()}")
         
-        # Check if items are positioned correctly
-        places = [item for item in scene_items if hasattr(item, 'place_data')]
-        transitions = [item for item in scene_items if hasattr(item, 'transition_data')]
-        
+        # Log how many places and transitions made it into the scene
         self.log_debug(f"Place items: {len(places)}")
         self.log_debug(f"Transition items: {len(transitions)}")
         
@@ -180,6 +192,8 @@ class DebugWindow(QMainWindow):
             self.log_debug("3. Make sure the parser is generating valid place and transition data")
             self.log_debug("4. Check if view settings like transform or visibility are correct")
             self.log_debug("5. Verify PetriNetScene constructor is correctly setting up properties")
+        
+        self.flush_log()
 
 def run_debugger():
     """Run the debugger application"""
@@ -2,7 +2,6 @@ import sys
 from PyQt5.QtWidgets import QApplication
 from ui.main_window import MainWindow
 from ui.settings_window import LayoutSettingsWindow
-from models.file_manager import FileManager
 
 def main():
     # Create the application
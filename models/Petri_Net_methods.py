@@ -1,7 +1,32 @@
+from collections import OrderedDict
 
+# Most recently used state machines, keyed by net id, name, state limit and
+# the full structure of the net, holding at most _SM_CACHE_SIZE entries
+_SM_CACHE = OrderedDict()
+_SM_CACHE_SIZE = 32
 
 
-def petri_to_state_machine(parser, net_id=None):
+def _structure_key(places, transitions, arcs):
+    """The parts of a Petri net that determine its state machine, in net order"""
+    return (
+        tuple((p['id'], p.get('tokens', 0), p.get('name', f"p{p['id']}")) for p in places),
+        tuple((t['id'], t['name']) for t in transitions),
+        tuple((a['source_id'], a['target_id'], a['is_place_to_transition']) for a in arcs)
+    )
+
+
+def _copy_state_machine(state_machine):
+    """Copy a state machine dict deeply enough that callers can mutate it freely"""
+    copied = dict(state_machine)
+    copied['states'] = [
+        dict(state, places=list(state['places']), place_names=list(state['place_names']))
+        for state in state_machine['states']
+    ]
+    copied['edges'] = [dict(edge) for edge in state_machine['edges']]
+    return copied
+
+
+def petri_to_state_machine(parser, net_id=None, max_states=10000):
     """
     Convert a Petri net to a state machine where:
     - States represent sets of marked places
@@ -11,6 +36,9 @@ def petri_to_state_machine(parser, net_id=None):
         parser: The ProcessAlgebraParser instance containing the Petri net
         net_id: Optional ID of a specific Petri net stored in parser.petri_nets
                If None, uses the current active Petri net in the parser
+        max_states: Maximum number of states to explore. Reachability graphs can
+               be very large or infinite, so exploration stops adding new states
+               once this many have been found
         
     Returns:
         dict: A state machine dictionary with the following structure:
@@ -33,118 +61,158 @@ def petri_to_state_machine(parser, net_id=None):
                         'name': str     # Transition name
                     },
                     ...
-                ]
+                ],
+                'truncated': bool       # Whether max_states cut exploration short
             }
     """
-    # If net_id is provided, load that specific Petri net
-    original_places = None
-    original_transitions = None
-    original_arcs = None
-    original_net_id = None
-    
-    if net_id is not None and hasattr(parser, 'petri_nets') and net_id in parser.petri_nets:
-        # Store the current parser state
-        original_places = parser.places
-        original_transitions = parser.transitions
-        original_arcs = parser.arcs
-        original_net_id = parser.current_net if hasattr(parser, 'current_net') else None
-        
-        # Load the specified Petri net
+    # Read the places, transitions and arcs of the requested net without
+    # touching the parser's own state
+    if net_id is not None and net_id in getattr(parser, 'petri_nets', {}):
         net_data = parser.petri_nets[net_id]
-        parser.places = net_data['places']
-        parser.transitions = net_data['transitions']
-        parser.arcs = net_data['arcs']
-        
-    # Get the net name for our state machine
-    sm_name = "State Machine"
-    if net_id is not None and hasattr(parser, 'petri_nets') and net_id in parser.petri_nets:
-        sm_name = f"State Machine for {parser.petri_nets[net_id].get('name', net_id)}"
-    elif hasattr(parser, 'current_net') and parser.current_net is not None:
-        sm_name = f"State Machine for {parser.current_net}"
-    # Find all places and transitions
-    places = parser.places
-    transitions = parser.transitions
-    arcs = parser.arcs
+        places = net_data['places']
+        transitions = net_data['transitions']
+        arcs = net_data['arcs']
+        sm_name = f"State Machine for {net_data.get('name', net_id)}"
+    else:
+        places = parser.places
+        transitions = parser.transitions
+        arcs = parser.arcs
+        if getattr(parser, 'current_net', None) is not None:
+            sm_name = f"State Machine for {parser.current_net}"
+        else:
+            sm_name = "State Machine"
+    
+    # Return a copy of the cached result if this net has been explored before
+    cache_key = (net_id, sm_name, max_states, _structure_key(places, transitions, arcs))
+    if cache_key in _SM_CACHE:
+        _SM_CACHE.move_to_end(cache_key)
+        return _copy_state_machine(_SM_CACHE[cache_key])
     
-    # Create a mapping from place ID to place object for easy lookup
-    place_map = {place['id']: place for place in places}
-    transition_map = {trans['id']: trans for trans in transitions}
+    # Give every place its own bit so that a marking is a single int bitmask
+    place_bit = {}
     
-    # Find initially marked places (places with tokens)
-    initial_marking = frozenset(place['id'] for place in places if place.get('tokens', 0) > 0)
+    def place_mask(place_ids):
+        mask = 0
+        for place_id in place_ids:
+            if place_id not in place_bit:
+                place_bit[place_id] = 1 << len(place_bit)
+            mask |= place_bit[place_id]
+        return mask
     
-    # Create the initial state
-    states = {0: initial_marking}
+    # Map place IDs to places and find the initially marked places in one pass
+    place_map = {}
+    initial_marking = 0
+    for place in places:
+        place_id = place['id']
+        place_map[place_id] = place
+        bit = place_mask((place_id,))
+        if place.get('tokens', 0) > 0:
+            initial_marking |= bit
+    
+    # Create the initial state. States are numbered in discovery order, so
+    # the list index of a marking is its state ID
+    states = [initial_marking]
     state_to_id = {initial_marking: 0}
     initial_state = 0
-    next_state_id = 1
     
-    # Create transition function
+    # Create transition function, skipping duplicate (source, target, name) edges
     edges = []
+    seen_edges = set()
+    
+    # Collect the input and output place masks of every transition once, up front
+    t_in_mask = {transition['id']: 0 for transition in transitions}
+    t_out_mask = {transition['id']: 0 for transition in transitions}
+    for arc in arcs:
+        if arc['is_place_to_transition']:
+            if arc['target_id'] in t_in_mask:
+                t_in_mask[arc['target_id']] |= place_mask((arc['source_id'],))
+        elif arc['source_id'] in t_out_mask:
+            t_out_mask[arc['source_id']] |= place_mask((arc['target_id'],))
     
-    # Keep track of unexplored states
-    unexplored_states = [initial_marking]
+    # Lay the transitions out as a table and index it by input place, so each
+    # marking only checks the transitions that consume one of its tokens
+    transition_table = []
+    place_consumers = {}
+    always_enabled = []
+    for index, transition in enumerate(transitions):
+        in_mask = t_in_mask[transition['id']]
+        transition_table.append((in_mask, t_out_mask[transition['id']], transition['name']))
+        if not in_mask:
+            always_enabled.append(index)
+        remaining = in_mask
+        while remaining:
+            bit = remaining & -remaining
+            place_consumers.setdefault(bit, []).append(index)
+            remaining ^= bit
     
-    while unexplored_states:
-        current_marking = unexplored_states.pop(0)
-        current_state_id = state_to_id[current_marking]
+    # Explore states breadth first; every state from current_state_id onwards
+    # is still unexplored, so the states list doubles as the BFS queue
+    current_state_id = 0
+    truncated = False
+    consumers_of = place_consumers.get
+    
+    while current_state_id < len(states):
+        current_marking = states[current_state_id]
         
-        # Find all enabled transitions from this marking
-        for transition in transitions:
-            transition_id = transition['id']
-            transition_name = transition['name']
-            
-            # Check if this transition is enabled (all input places have tokens)
-            input_places = set()
-            for arc in arcs:
-                if arc['target_id'] == transition_id and arc['is_place_to_transition']:
-                    input_places.add(arc['source_id'])
+        # Gather the transitions that take a token from a marked place
+        candidates = set(always_enabled)
+        remaining = current_marking
+        while remaining:
+            bit = remaining & -remaining
+            candidates.update(consumers_of(bit, ()))
+            remaining ^= bit
+        
+        # Find all enabled transitions from this marking, in net order
+        for index in sorted(candidates):
+            in_mask, out_mask, transition_name = transition_table[index]
             
             # Transition is enabled if all input places are in the current marking
-            if all(place_id in current_marking for place_id in input_places):
-                # Transition is enabled - compute new marking
-                new_marking = set(current_marking)
-                
-                # Remove tokens from input places
-                for input_place in input_places:
-                    new_marking.remove(input_place)
-                
-                # Add tokens to output places
-                output_places = set()
-                for arc in arcs:
-                    if arc['source_id'] == transition_id and not arc['is_place_to_transition']:
-                        output_places.add(arc['target_id'])
-                
-                new_marking.update(output_places)
-                
-                # Convert to frozenset for hashability
-                new_marking_frozen = frozenset(new_marking)
+            if current_marking & in_mask == in_mask:
+                # Transition is enabled - move tokens from input to output places
+                new_marking = (current_marking & ~in_mask) | out_mask
                 
                 # Create a new state if we haven't seen this marking before
-                if new_marking_frozen not in state_to_id:
-                    state_to_id[new_marking_frozen] = next_state_id
-                    states[next_state_id] = new_marking_frozen
-                    unexplored_states.append(new_marking_frozen)
-                    next_state_id += 1
+                target_state_id = state_to_id.get(new_marking)
+                if target_state_id is None:
+                    if len(states) >= max_states:
+                        truncated = True
+                        continue
+                    target_state_id = len(states)
+                    state_to_id[new_marking] = target_state_id
+                    states.append(new_marking)
                 
                 # Add the transition
-                target_state_id = state_to_id[new_marking_frozen]
+                edge_key = (current_state_id, target_state_id, transition_name)
+                if edge_key in seen_edges:
+                    continue
+                seen_edges.add(edge_key)
                 edges.append({
                     'source': current_state_id,
                     'target': target_state_id,
                     'name': transition_name
                 })
+        
+        current_state_id += 1
     
     # Generate the structured state machine dictionary
     state_machine = {
         'id': net_id or 'current',
         'name': sm_name,
         'states': [],
-        'edges': edges
+        'edges': edges,
+        'truncated': truncated
     }
     
     # Convert states to the desired format
-    for state_id, marking in states.items():
+    bit_place = {bit: place_id for place_id, bit in place_bit.items()}
+    for state_id, mask in enumerate(states):
+        # Decode the bitmask back into place IDs, lowest bit first
+        marking = []
+        while mask:
+            bit = mask & -mask
+            marking.append(bit_place[bit])
+            mask ^= bit
+        
         # Get place names for this state
         place_names = []
         for place_id in marking:
@@ -155,19 +223,14 @@ def petri_to_state_machine(parser, net_id=None):
         state_machine['states'].append({
             'id': state_id,
             'name': f"State {state_id}",
-            'places': list(marking),  # Convert frozenset to list
+            'places': marking,
             'place_names': sorted(place_names),  # Sorted place names for readability
             'is_initial': state_id == initial_state
         })
     
-    # Restore original parser state if we loaded a specific net
-    if original_places is not None:
-        parser.places = original_places
-        parser.transitions = original_transitions
-        parser.arcs = original_arcs
-        if original_net_id is not None and hasattr(parser, 'current_net'):
-            parser.current_net = original_net_id
-    
+    _SM_CACHE[cache_key] = _copy_state_machine(state_machine)
+    if len(_SM_CACHE) > _SM_CACHE_SIZE:
+        _SM_CACHE.popitem(last=False)
     return state_machine
 
 def print_state_machine(state_machine):
@@ -179,6 +242,8 @@ def print_state_machine(state_machine):
     """
     print(f"State Machine: {state_machine['name']}")
     print("=============")
+    if state_machine.get('truncated'):
+        print(f"Warning: state space truncated after {len(state_machine['states'])} states")
     
     print("\nStates:")
     print("------")
@@ -205,7 +270,7 @@ def get_available_petri_nets(parser):
     if hasattr(parser, 'get_all_petri_nets'):
         return parser.get_all_petri_nets()
     elif hasattr(parser, 'petri_nets'):
-        return [{'id': net_id, 'name': data.get('name', net_id)} 
+        return [{'id': net_id, 'name': data.get('name', net_id)}
                 for net_id, data in parser.petri_nets.items()]
     else:
         return []
@@ -218,25 +283,29 @@ def visualize_state_machine(state_machine, output_filename='state_machine.dot'):
         state_machine: State machine dictionary
         output_filename: Filename to save the DOT file
     """
+    parts = [
+        'digraph state_machine {\n',
+        '    rankdir=LR;\n',
+        '    node [shape = circle];\n'
+    ]
+    
+    # Write states
+    for state in state_machine['states']:
+        place_names = ', '.join(state['place_names'])
+        label = f"S{state['id']}\\n{place_names}"
+        if state['is_initial']:
+            parts.append(f'    {state["id"]} [label="{label}", style=filled, fillcolor=lightblue];\n')
+        else:
+            parts.append(f'    {state["id"]} [label="{label}"];\n')
+    
+    # Write transitions
+    for edge in state_machine['edges']:
+        parts.append(f'    {edge["source"]} -> {edge["target"]} [label="{edge["name"]}"];\n')
+    
+    parts.append('}\n')
+    
     with open(output_filename, 'w') as f:
-        f.write('digraph state_machine {\n')
-        f.write('    rankdir=LR;\n')
-        f.write('    node [shape = circle];\n')
-        
-        # Write states
-        for state in state_machine['states']:
-            place_names = ', '.join(state['place_names'])
-            label = f"S{state['id']}\\n{place_names}"
-            if state['is_initial']:
-                f.write(f'    {state["id"]} [label="{label}", style=filled, fillcolor=lightblue];\n')
-            else:
-                f.write(f'    {state["id"]} [label="{label}"];\n')
-        
-        # Write transitions
-        for edge in state_machine['edges']:
-            f.write(f'    {edge["source"]} -> {edge["target"]} [label="{edge["name"]}"];\n')
-        
-        f.write('}\n')
+        f.write(''.join(parts))
     
     print(f"State machine visualization saved to {output_filename}")
     print("You can render it using Graphviz with the command:")
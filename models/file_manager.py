@@ -1,8 +1,38 @@
 import os
+import re
 import json
+import time
 import configparser
 from pathlib import Path
 
+__all__ = ['FileManager']
+
+# orjson is optional; it makes saving and loading large nets much faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(data, pretty=True):
+    """Serialize data to JSON bytes, indented by two spaces if pretty"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    # Like orjson, write non-ASCII text as UTF-8 rather than \u escapes
+    if pretty:
+        return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _loads(raw):
+    """Parse JSON from bytes"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
 class FileManager:
     """Manager for loading and saving Petri nets to/from files"""
     
@@ -23,6 +53,17 @@ class FileManager:
             self.config.add_section('General')
             self.config.set('General', 'last_net', '')
             self._save_config()
+        
+        # In-memory copy of last_net, so unchanged values are not rewritten
+        self._last_net_cached = self.config.get('General', 'last_net', fallback='')
+        
+        # Result of the last check that last_net exists, and when it was made
+        self._last_net_exists = False
+        self._last_net_checked_at = None
+        
+        # Listing of the nets directory, reused until the directory changes
+        self._nets_cache = None
+        self._nets_cache_mtime = -1
     
     def _save_config(self):
         """Save configuration to file"""
@@ -31,18 +72,32 @@ class FileManager:
     
     def get_last_net(self):
         """Get the path to the last opened Petri net"""
-        last_net = self.config.get('General', 'last_net', fallback='')
-        if last_net and Path(last_net).exists():
+        last_net = self._last_net_cached
+        if not last_net:
+            return None
+        
+        # Re-check that the file exists at most once a second
+        now = time.monotonic()
+        if self._last_net_checked_at is None or now - self._last_net_checked_at >= 1.0:
+            self._last_net_exists = Path(last_net).exists()
+            self._last_net_checked_at = now
+        
+        if self._last_net_exists:
             return last_net
         return None
     
     def set_last_net(self, net_path):
-        """Set the last opened Petri net"""
-        self.config.set('General', 'last_net', str(net_path))
+        """Set the last opened Petri net, writing the config file only if it changed"""
+        net_path = str(net_path)
+        if net_path == self._last_net_cached:
+            return
+        self.config.set('General', 'last_net', net_path)
+        self._last_net_cached = net_path
+        self._last_net_checked_at = None
         self._save_config()
     
-    def save_petri_net(self, parser, filename):
-        """Save a Petri net and parse tree to a JSON file"""
+    def save_petri_net(self, parser, filename, pretty=True):
+        """Save a Petri net and parse tree to a JSON file, indented unless pretty is False"""
         if not filename.endswith('.json'):
             filename += '.json'
         
@@ -66,12 +121,22 @@ class FileManager:
             'source_code': self._generate_source_code(parser)
         }
         
-        # Save to file
-        with open(file_path, 'w') as f:
-            json.dump(data, f, indent=2)
+        # Save to a temporary file first and move it into place, so that a
+        # failed write never leaves a half-written net behind, nor a stray
+        # temporary file
+        payload = _dumps(data, pretty)
+        tmp_path = file_path.with_suffix('.json.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
         
-        # Update last net
+        # Update last net, and make sure the new size and mtime get listed
         self.set_last_net(str(file_path))
+        self.invalidate_nets_cache()
         
         return str(file_path)
     
@@ -79,33 +144,38 @@ class FileManager:
         """Create expanded process definitions by replacing references"""
         expanded = process_definitions.copy()
         
-        # Track which definitions have been processed to avoid infinite recursion
-        processed = set()
+        # Fully expanded definitions by name. A name is seeded with its
+        # unexpanded form before its references are expanded, so a reference
+        # cycle back to it resolves to that form instead of recursing forever
+        cache = {}
+        
+        if not process_definitions:
+            return expanded
         
-        def expand_definition(name, depth=0):
+        # One whole-word pattern matching any process name. Longer names come
+        # first, so a name is never matched as the prefix of a longer one
+        names = sorted(process_definitions, key=len, reverse=True)
+        pattern = re.compile(r'\b(' + '|'.join(map(re.escape, names)) + r')\b')
+        
+        def expand_definition(name):
             """Recursively expand a single definition"""
-            if name in processed or depth > 10:  # Prevent infinite recursion
-                return expanded[name]
+            if name in cache:
+                return cache[name]
                 
-            processed.add(name)
-            definition = expanded[name]
+            cache[name] = expanded[name]
             
-            # Find all process references in this definition
-            for other_name in process_definitions:
-                if other_name != name:  # Avoid self-replacement
-                    # Replace only whole-word matches (not parts of identifiers)
-                    import re
-                    pattern = r'\b' + re.escape(other_name) + r'\b'
-                    
-                    # Check if we have a match
-                    if re.search(pattern, definition):
-                        # Get the expanded definition for the reference
-                        other_expanded = expand_definition(other_name, depth + 1)
-                        
-                        # Replace references with expanded definition
-                        definition = re.sub(pattern, f"({other_expanded})", definition)
+            def replace_reference(match):
+                other_name = match.group(1)
+                if other_name == name:  # Avoid self-replacement
+                    return other_name
+                return f"({expand_definition(other_name)})"
+            
+            # Replace every process reference with its expanded definition in
+            # a single scan of the definition
+            definition = pattern.sub(replace_reference, expanded[name])
             
             # Update the expanded dictionary
+            cache[name] = definition
             expanded[name] = definition
             return definition
         
@@ -117,28 +187,43 @@ class FileManager:
         
     def _generate_source_code(self, parser):
         """Generate process algebra source code from the parser"""
-        source_code = []
-        for process_name, definition in parser.process_definitions.items():
-            source_code.append(f"{process_name} = {definition}")
-        return "\n".join(source_code)
+        return "\n".join(f"{process_name} = {definition}"
+                         for process_name, definition in parser.process_definitions.items())
     
 
     
+    def invalidate_nets_cache(self):
+        """Force the next get_available_nets call to re-read the nets directory"""
+        self._nets_cache = None
+        self._nets_cache_mtime = -1
+    
     def get_available_nets(self):
         """Get a list of available Petri net files"""
+        # Adding or removing a file changes the directory mtime; rewriting an
+        # existing one does not, so save_petri_net invalidates the cache itself
+        mtime = self.nets_dir.stat().st_mtime_ns
+        if self._nets_cache is not None and mtime == self._nets_cache_mtime:
+            return list(self._nets_cache)
+        
         nets = []
-        for path in self.nets_dir.glob('*.json'):
-            nets.append({
-                'name': path.stem,
-                'path': str(path),
-                'size': path.stat().st_size,
-                'modified': path.stat().st_mtime
-            })
+        with os.scandir(self.nets_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                nets.append({
+                    'name': entry.name[:-len('.json')],
+                    'path': entry.path,
+                    'size': stat.st_size,
+                    'modified': stat.st_mtime
+                })
         
         # Sort by modification time (newest first)
         nets.sort(key=lambda x: x['modified'], reverse=True)
         
-        return nets
+        self._nets_cache = nets
+        self._nets_cache_mtime = mtime
+        return list(nets)
     
 
     #######################
@@ -149,42 +234,40 @@ class FileManager:
             return None
         
         try:
-            with open(path, 'r') as f:
-                data = json.load(f)
+            with open(path, 'rb') as f:
+                data = _loads(f.read())
             
-            # Add backward compatibility for arc process names
-            if 'arcs' in data:
-                # Create a mapping of IDs to process names for backward compatibility
-                process_map = {}
-                
-                # Add place processes to the map
-                if 'places' in data:
-                    for place in data['places']:
-                        if 'id' in place and 'process' in place:
-                            process_map[place['id']] = place['process']
-                
-                # Add transition processes to the map
-                if 'transitions' in data:
-                    for transition in data['transitions']:
-                        if 'id' in transition and 'process' in transition:
-                            process_map[transition['id']] = transition['process']
+            # Add backward compatibility for arc process names. Files saved
+            # since arcs carried process names need no work at all
+            arcs = data.get('arcs') or []
+            if not all('process' in arc for arc in arcs):
+                # Create a mapping of IDs to process names from the places and transitions
+                process_map = {place['id']: place['process']
+                               for place in data.get('places', [])
+                               if 'id' in place and 'process' in place}
+                process_map.update({transition['id']: transition['process']
+                                    for transition in data.get('transitions', [])
+                                    if 'id' in transition and 'process' in transition})
                 
                 # Update arcs with process information if missing
-                for arc in data['arcs']:
-                    if 'process' not in arc:
-                        source_id = arc.get('source_id')
-                        target_id = arc.get('target_id')
-                        
-                        # Try to get process name from source
-                        if source_id in process_map:
-                            arc['process'] = process_map[source_id]
-                        # If not found in source, try target
-                        elif target_id in process_map:
-                            arc['process'] = process_map[target_id]
-                        # If neither source nor target has process info, use the file name
-                        else:
+                net_name = None
+                for arc in arcs:
+                    if 'process' in arc:
+                        continue
+                    source_id = arc.get('source_id')
+                    target_id = arc.get('target_id')
+                    
+                    # Try to get process name from source
+                    if source_id in process_map:
+                        arc['process'] = process_map[source_id]
+                    # If not found in source, try target
+                    elif target_id in process_map:
+                        arc['process'] = process_map[target_id]
+                    # If neither source nor target has process info, use the file name
+                    else:
+                        if net_name is None:
                             net_name = path.stem.replace("_", " ").title()
-                            arc['process'] = net_name
+                        arc['process'] = net_name
             
             # Update last net
             self.set_last_net(str(path))
@@ -1,7 +1,52 @@
 # Complete fixed version of the ProcessAlgebraParser
 
 import re
+import sys
 import math
+from functools import lru_cache
+
+# Matches each whole word of an expression, the candidates for process references
+_WORD = re.compile(r'\w+')
+
+# Matches every parenthesis in an expression, so scans can skip the other characters
+_PARENS = re.compile(r'[()]')
+
+# Patterns matching the parentheses plus one operator character, by operator
+_SPLIT_PATTERNS = {}
+
+
+@lru_cache(maxsize=None)
+def word_pattern(name):
+    """Compiled pattern matching a process name as a whole word, built once per name"""
+    return re.compile(r'\b' + re.escape(name) + r'\b')
+
+
+def find_references(process_definitions):
+    """
+    Map each process name to the other process names its expression mentions.
+    
+    Args:
+        process_definitions: Dict of process name to expression
+        
+    Returns:
+        dict: Process name to the list of names it references, in definition order
+    """
+    order = {name: index for index, name in enumerate(process_definitions)}
+
+    # A name made of word characters is referenced exactly when it is one
+    # of the expression's whole words, so one tokenization and a set
+    # intersection cover all of them. Any other name gets its own search
+    patterns = {name: word_pattern(name) for name in order if not _WORD.fullmatch(name)}
+
+    references = {}
+    for name, expr in process_definitions.items():
+        found = set(_WORD.findall(expr)).intersection(order)
+        found.update(other for other, pattern in patterns.items() if pattern.search(expr))
+        found.discard(name)
+        references[name] = sorted(found, key=order.__getitem__)
+    return references
+
+
 class ProcessAlgebraParser:
     def __init__(self):
         self.places = []
@@ -17,6 +62,11 @@ class ProcessAlgebraParser:
         self.petri_nets = {}  # Dictionary to individual store petri nets with their data
         self.current_net = None  # Track the current net being viewed
         self.ref_process = {}
+        self._references = {}  # Process name -> other process names its expression mentions
+        self._place_index = {}  # Place id -> place, for the places list below
+        self._indexed_places = None  # The places list that _place_index covers
+        self._indexed_count = 0  # How many of its places have been indexed
+        self._split_cache = {}  # (operator, expression) -> its top-level split, for the current parse
     
     def reset(self):
         self.places = []
@@ -28,6 +78,8 @@ class ProcessAlgebraParser:
         self.referenced_processes = set()
         self.parsed_processes = set()
         self.parsing_errors = []
+        self._references = {}
+        self._split_cache = {}
         # Keep petri_nets dictionary intact when resetting
     x_toggal = True
     y_toggal = True
@@ -53,18 +105,18 @@ class ProcessAlgebraParser:
             for line in lines:
                 if '=' in line:
                     name, expr = line.split('=', 1)
-                    name = name.strip()
+                    # Interned, so every copy of the name (node fields, reference sets,
+                    # petri_nets snapshots) shares one object
+                    name = sys.intern(name.strip())
                     expr = expr.strip()
                     self.process_definitions[name] = expr
             
             # Find processes referenced by others
-            for name, expr in self.process_definitions.items():
-                for other_name in self.process_definitions:
-                    if other_name != name:
-                        pattern = r'\b' + re.escape(other_name) + r'\b'
-                        if re.search(pattern, expr):
-                            self.referenced_processes.add(other_name)
-                            self.ref_process[other_name]   = name
+            self._references = self.find_references()
+            for name, others in self._references.items():
+                for other_name in others:
+                    self.referenced_processes.add(other_name)
+                    self.ref_process[other_name]   = name
                             
             print(f"ref_process: {self.ref_process}")
 
@@ -126,8 +178,8 @@ class ProcessAlgebraParser:
         print(f"Storing current Petri net with name {name}")
         net_id = name.lower().replace(" ", "_")
         
-        # Create a deep copy of the current state with filtering
-        import copy
+        # Copy the current state with filtering. Node dicts hold only scalars
+        # but the UI edits them in place, so each one gets a shallow copy
         
         # Filter places, transitions, and arcs that belong to this process
         filtered_places = []
@@ -138,14 +190,14 @@ class ProcessAlgebraParser:
         process_place_ids = set()
         for place in self.places:
             if place.get('process') == name or place.get('name') == name:
-                filtered_places.append(copy.deepcopy(place))
+                filtered_places.append(dict(place))
                 process_place_ids.add(place['id'])
         
         # Next collect all transitions for this process
         process_transition_ids = set()
         for transition in self.transitions:
             if transition.get('process') == name:
-                filtered_transitions.append(copy.deepcopy(transition))
+                filtered_transitions.append(dict(transition))
                 process_transition_ids.add(transition['id'])
         
         # Finally collect all arcs that connect places and transitions in this process
@@ -162,9 +214,7 @@ class ProcessAlgebraParser:
             
             if source_in_process and target_in_process:
                 # Add the process name to the arc
-                arc_copy = copy.deepcopy(arc)
-                arc_copy['process'] = name
-                filtered_arcs.append(arc_copy)
+                filtered_arcs.append(dict(arc, process=name))
         
         # Store all the data needed to recreate this net
         self.petri_nets[name] = {
@@ -173,9 +223,9 @@ class ProcessAlgebraParser:
             'places': filtered_places,
             'transitions': filtered_transitions,
             'arcs': filtered_arcs,
-            'process_definitions': copy.deepcopy(self.process_definitions),
-            'process_places': copy.deepcopy(self.process_places),
-            'main_processes': copy.deepcopy(self.main_processes),
+            'process_definitions': dict(self.process_definitions),
+            'process_places': dict(self.process_places),
+            'main_processes': dict(self.main_processes),
             'last_id': self.current_id
         }
         print(f"Stored Petri net with ID {name}")
@@ -227,7 +277,30 @@ class ProcessAlgebraParser:
                 self.build_petri_net(process_name, position_index)
     
     def build_petri_net(self, process_name, index):
-        """Build the Petri net for a process definition"""
+        """Build the Petri net for a process definition, then any processes it references"""
+        # Referenced processes are built depth first, as nested calls would
+        # build them, but from an explicit stack of the references each
+        # process still has to visit, so long chains cannot hit the
+        # recursion limit
+        pending = [self._build_process(process_name, index)]
+        while pending:
+            for ref_process in pending[-1]:
+                if ref_process not in self.parsed_processes and ref_process in self.process_places:
+                    # Use a new index based on current parsed processes
+                    ref_index = len(self.parsed_processes)
+                    #print(f"Building referenced process {ref_process} at index {ref_index}")
+                    pending.append(self._build_process(ref_process, ref_index))
+                    break
+            else:
+                pending.pop()
+    
+    def _build_process(self, process_name, index):
+        """
+        Build the Petri net for a single process definition.
+        
+        Returns:
+            iterator: The referenced processes that were not built yet
+        """
         print(f"parser Building Petri net for process {process_name}")
         
         # Mark this process as parsed
@@ -241,32 +314,117 @@ class ProcessAlgebraParser:
         self.parse_expression(expr, place_id, process_name, base_y)
         
         # Check if this process references others and ensure they're built
+        if process_name not in self._references:
+            self._references = self.find_references()
         referenced = set()
-        for other_name in self.process_definitions:
-            if other_name != process_name:
-                pattern = r'\b' + re.escape(other_name) + r'\b'
-                if re.search(pattern, expr) and other_name not in self.parsed_processes:
-                    referenced.add(other_name)
-        
-        # Build any directly referenced processes that haven't been built yet
-        for ref_process in referenced:
-            if ref_process not in self.parsed_processes and ref_process in self.process_places:
-                # Use a new index based on current parsed processes
-                ref_index = len(self.parsed_processes)
-                #print(f"Building referenced process {ref_process} at index {ref_index}")
-                self.build_petri_net(ref_process, ref_index)
+        for other_name in self._references[process_name]:
+            if other_name not in self.parsed_processes:
+                referenced.add(other_name)
+        return iter(referenced)
 
+    def find_references(self):
+        """Map each process name to the other process names its expression mentions, in definition order"""
+        return find_references(self.process_definitions)
+    
     def parse_expression(self, expr, place_id, process_name, base_y):
         """Parse a process algebra expression and build the Petri net"""
-        expr = self.remove_outer_parentheses(expr)
+        is_choice, parts = self.split_choices(expr)
         
         # Handle choice operator
-        if '+' in expr and not self.is_in_parentheses(expr, expr.find('+')):
-            choices = self.split_by_operator(expr, '+')
-            for i, choice in enumerate(choices):
+        if is_choice:
+            for i, choice in enumerate(parts):
                 self.parse_sequence(choice.strip(), place_id, process_name, base_y + i * 80)
         else:
-            self.parse_sequence(expr, place_id, process_name, base_y)
+            self.parse_sequence(parts[0], place_id, process_name, base_y)
+    
+    def split_choices(self, expr):
+        """
+        Split an expression into its top-level choices.
+        
+        Results are memoized on the expression string until the next reset,
+        so an expression met again during the same parse is not rescanned.
+        
+        Returns:
+            tuple: (is_choice, parts) where parts are the choices, or just the
+                   expression without its outer parentheses if it is not a choice
+        """
+        key = ('+', expr)
+        if key not in self._split_cache:
+            expr, choices = self._split_outer(expr, '+')
+            # The expression is a choice if any '+' is at the top level, which
+            # is exactly when splitting at the top-level '+'s changes it
+            if expr and choices != [expr]:
+                self._split_cache[key] = (True, tuple(choices))
+            else:
+                self._split_cache[key] = (False, (expr,))
+        return self._split_cache[key]
+    
+    def split_sequence(self, sequence):
+        """Split a sequence like a.b.P into its top-level parts, memoized like split_choices"""
+        key = ('.', sequence)
+        if key not in self._split_cache:
+            self._split_cache[key] = tuple(self._split_outer(sequence, '.')[1])
+        return self._split_cache[key]
+    
+    def _split_outer(self, expr, operator):
+        """
+        Remove an expression's outer parentheses and split it by a one
+        character operator in a single scan.
+        
+        The same as remove_outer_parentheses followed by split_by_operator:
+        while the parentheses are scanned for a match, the operators one
+        level inside them are collected too, so the inner text needs no
+        second scan.
+        
+        Returns:
+            tuple: (expr without its outer parentheses, list of parts)
+        """
+        expr = expr.strip()
+        if '(' not in expr and ')' not in expr:
+            return expr, self.split_by_operator(expr, operator)
+        
+        pattern = _SPLIT_PATTERNS.get(operator)
+        if pattern is None:
+            pattern = _SPLIT_PATTERNS[operator] = re.compile('[()' + re.escape(operator) + ']')
+        
+        # Operator positions at the top level and one level down
+        outer = []
+        inner = []
+        paren_level = 0
+        wrapped = expr.startswith('(') and expr.endswith(')')
+        
+        for match in pattern.finditer(expr):
+            char = match.group()
+            if char == '(':
+                paren_level += 1
+            elif char == ')':
+                paren_level -= 1
+                # The first '(' only wraps the expression if it closes last
+                if paren_level == 0 and wrapped and match.start() != len(expr) - 1:
+                    wrapped = False
+            elif paren_level == 0:
+                outer.append(match.start())
+            elif paren_level == 1:
+                inner.append(match.start())
+        
+        if wrapped and paren_level == 0:
+            body = expr[1:-1]
+            start = 1 + len(body) - len(body.lstrip())
+            expr = body.strip()
+            positions = [pos - start for pos in inner]
+        else:
+            positions = outer
+        
+        parts = []
+        start = 0
+        for pos in positions:
+            parts.append(expr[start:pos])
+            start = pos + 1
+        # There is no empty part after a trailing operator
+        if start < len(expr):
+            parts.append(expr[start:])
+        
+        return expr, parts
     #####################
     def create_action_transition(self, action, place_id, process_name, y_pos, x_offset=0):
         """Create a transition for an action"""
@@ -274,7 +432,7 @@ class ProcessAlgebraParser:
         transition_id = self.get_id()
         self.transitions.append({
             'id': transition_id,
-            'name': action,
+            'name': sys.intern(action),
             'x': self.get_place_x(place_id) + x_offset,
             'y': self.get_place_y(place_id) + x_offset,
             'process': process_name
@@ -292,29 +450,38 @@ class ProcessAlgebraParser:
 
     def parse_sequence(self, sequence, place_id, process_name, y_pos):
         """Parse a sequence like a.b.P"""
-        sequence = self.remove_outer_parentheses(sequence)
-        
         # Split the sequence by dot operator
-        parts = self.split_by_operator(sequence, '.')
+        parts = self.split_sequence(sequence)
         
         # Keep track of current place for the sequence
         current_place_id = place_id
         x_offset = 20
         y_offset = 20
         
+        # Bind the lookups the loop repeats for every part
+        count = len(parts)
+        definitions = self.process_definitions
+        process_places = self.process_places
+        places = self.places
+        arcs = self.arcs
+        
+        # The process that owns this sequence's nodes is the same for every part
+        p_name = process_name if process_name in self.main_processes else self.ref_process[process_name]
+        
         for i, part in enumerate(parts):
+            # Most parts are bare actions, which have no parentheses to remove
             part = part.strip()
-            part = self.remove_outer_parentheses(part)
+            if part.startswith('('):
+                part = self.remove_outer_parentheses(part)
                 
-            if len(parts) > i+1:
+            if count > i+1:
                 look_ahead = parts[i+1]
-                p_name = process_name if process_name in self.main_processes else self.ref_process[process_name]
                    
                 # Special handling for STOP
                 if look_ahead == 'STOP':
                     # Create STOP place
                     stop_place_id = self.get_id()
-                    self.places.append({
+                    places.append({
                         'id': stop_place_id,
                         'name': 'STOP',
                         'tokens': 0,
@@ -325,35 +492,34 @@ class ProcessAlgebraParser:
                     })
                     transition_id = self.create_action_transition(part, current_place_id, p_name, y_pos, x_offset)            
                     # Connect transition to STOP place
-                    self.arcs.append({
+                    arcs.append({
                         'source_id': transition_id,
                         'target_id': stop_place_id,
                         'is_place_to_transition': False,
                         'process': p_name  # Add process name to the arc
                     })
                     break
-                elif look_ahead in self.process_definitions: # process the end of sequence
-                    local_process_id = self.process_places[look_ahead]
+                elif look_ahead in definitions: # process the end of sequence
+                    local_process_id = process_places[look_ahead]
                     transition_id = self.create_action_transition(part, current_place_id, p_name, y_pos, x_offset)
-                   # p_name = process_name if process_name in self.main_processes else self.ref_process[process_name]
                     
-                    self.arcs.append({
+                    arcs.append({
                         'source_id': transition_id,
-                        'target_id': self.process_places[look_ahead],
+                        'target_id': local_process_id,
                         'is_place_to_transition': False,
                         'process': p_name  # Add process name to the arc
                     })
                     break
 
-            if len(parts) == i + 1: #last event 
+            if count == i + 1: #last event 
                     transition_id = self.create_action_transition(part, current_place_id, p_name, y_pos, x_offset)                               
                     #(f"Created arc from {current_place_id} to {transition_id}")
                     #adds arc from current place to transition  
-            if len(parts) > i + 1:
+            if count > i + 1:
                     transition_id = self.create_action_transition(part, current_place_id, p_name, y_pos, x_offset)
                     
                     new_place_id = self.get_id()
-                    self.places.append({
+                    places.append({
                             'id': new_place_id,
                             'name': "",
                             'tokens': 0,
@@ -362,7 +528,7 @@ class ProcessAlgebraParser:
                             'is_terminal': False,
                             'process': p_name
                     })
-                    self.arcs.append({
+                    arcs.append({
                             'source_id': transition_id, #previous transition to new place
                             'target_id': new_place_id,
                             'is_place_to_transition': False,
@@ -376,28 +542,43 @@ class ProcessAlgebraParser:
     #####################
  
  
+    def _find_place(self, place_id):
+        """Find a place by id, indexing any places appended since the last lookup"""
+        places = self.places
+        if places is not self._indexed_places or len(places) < self._indexed_count:
+            self._place_index = {}
+            self._indexed_places = places
+            self._indexed_count = 0
+        
+        # Keep the first place with each id, as a scan of the list would
+        for index in range(self._indexed_count, len(places)):
+            self._place_index.setdefault(places[index]['id'], places[index])
+        self._indexed_count = len(places)
+        
+        return self._place_index.get(place_id)
+    
     def get_place_x(self, place_id):
         """Get the x coordinate of a place"""
-        for place in self.places:
-            if place['id'] == place_id:
-                if  self.x_toggal :
-                    self.x_toggal = False
-                    return place['x'] + 100
-                else:
-                    self.x_toggal = True
-                    return place['x'] + 50
+        place = self._find_place(place_id)
+        if place is not None:
+            if  self.x_toggal :
+                self.x_toggal = False
+                return place['x'] + 100
+            else:
+                self.x_toggal = True
+                return place['x'] + 50
                
         return 100  # Default
     def get_place_y(self, place_id):
         """Get the x coordinate of a place"""
-        for place in self.places:
-            if place['id'] == place_id:
-                if  self.y_toggal :
-                    self.y_toggal = False
-                    return place['y'] + 100
-                else:
-                    self.y_toggal = True
-                    return place['y'] + 50
+        place = self._find_place(place_id)
+        if place is not None:
+            if  self.y_toggal :
+                self.y_toggal = False
+                return place['y'] + 100
+            else:
+                self.y_toggal = True
+                return place['y'] + 50
                
         return 100  # Default
     
@@ -406,16 +587,17 @@ class ProcessAlgebraParser:
         expr = expr.strip()
         
         if expr.startswith('(') and expr.endswith(')'):
-            # Check if these are matching outer parentheses
+            # Check if these are matching outer parentheses, looking only at
+            # the parentheses themselves
             open_count = 0
-            for i, char in enumerate(expr):
-                if char == '(':
+            for match in _PARENS.finditer(expr):
+                if match.group() == '(':
                     open_count += 1
-                elif char == ')':
+                else:
                     open_count -= 1
-                    if open_count == 0 and i == len(expr) - 1:
-                        return expr[1:-1].strip()
-                    if open_count == 0 and i < len(expr) - 1:
+                    if open_count == 0:
+                        if match.start() == len(expr) - 1:
+                            return expr[1:-1].strip()
                         return expr
         
         return expr
@@ -425,29 +607,37 @@ class ProcessAlgebraParser:
         if pos < 0 or pos >= len(expr):
             return False
         
-        open_count = 0
-        for i in range(pos):
-            if expr[i] == '(':
-                open_count += 1
-            elif expr[i] == ')':
-                open_count -= 1
-        
-        return open_count > 0
+        return expr.count('(', 0, pos) > expr.count(')', 0, pos)
     
     def split_by_operator(self, expr, operator):
         """Split expression by an operator, respecting parentheses"""
+        # Without parentheses every operator is at the top level
+        if '(' not in expr and ')' not in expr:
+            result = expr.split(operator) if len(operator) == 1 else [expr]
+            # There is no empty part after a trailing operator
+            if not result[-1]:
+                result.pop()
+            return result
+        
+        pattern = _SPLIT_PATTERNS.get(operator)
+        if pattern is None:
+            single = len(operator) == 1
+            pattern = re.compile('[()' + re.escape(operator) + ']') if single else _PARENS
+            _SPLIT_PATTERNS[operator] = pattern
+        
         result = []
         start = 0
         paren_level = 0
         
-        for i, char in enumerate(expr):
+        for match in pattern.finditer(expr):
+            char = match.group()
             if char == '(':
                 paren_level += 1
             elif char == ')':
                 paren_level -= 1
-            elif char == operator and paren_level == 0:
-                result.append(expr[start:i])
-                start = i + 1
+            elif paren_level == 0:
+                result.append(expr[start:match.start()])
+                start = match.start() + 1
         
         # Add the last part
         if start < len(expr):
@@ -455,6 +645,11 @@ class ProcessAlgebraParser:
         
         return result
     
+    def export_to_process_algebra(self):
+        """Return the process definitions as process algebra source, one 'name = expression' line each"""
+        return "".join(f"{process_name} = {definition}\n"
+                       for process_name, definition in self.process_definitions.items())
+    
     def get_parsing_errors(self):
         """Return any parsing errors"""
         if not self.parsing_errors:
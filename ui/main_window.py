@@ -1426,11 +1426,6 @@ Main = (Process) | (Query)"""
                 import os
                 filename = os.path.basename(file_path)
                 
-                # Create the process algebra source code
-                source_code = ""
-                for process_name, definition in self.parser.process_definitions.items():
-                    source_code += f"{process_name} = {definition}\n"
-                
                 # Save the Petri net to a JSON file
                 saved_path = self.file_manager.save_petri_net(self.parser, filename)
                 
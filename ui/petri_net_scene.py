@@ -896,6 +896,7 @@ class DraggableScene(PetriNetScene):
         ellipse.setFlag(QGraphicsItem.ItemIsMovable)
         ellipse.setFlag(QGraphicsItem.ItemIsSelectable)
         ellipse.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
+        ellipse.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
         
         # Store reference to the original data
         ellipse.place_data = place
@@ -917,6 +918,7 @@ class DraggableScene(PetriNetScene):
         rect.setFlag(QGraphicsItem.ItemIsMovable)
         rect.setFlag(QGraphicsItem.ItemIsSelectable)
         rect.setFlag(QGraphicsItem.ItemSendsGeometryChanges)
+        rect.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
         
         # Store reference to the original data
         rect.transition_data = transition
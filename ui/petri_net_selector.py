@@ -3,8 +3,7 @@
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                             QPushButton, QLabel, QListWidget, QListWidgetItem)
 from PyQt5.QtCore import Qt, pyqtSignal
-from models.parser import ProcessAlgebraParser
-import re
+from models.parser import ProcessAlgebraParser, find_references
 
 class PetriNetSelectorWindow(QMainWindow):
     """Window for selecting a Petri net to visualize"""
@@ -72,14 +71,10 @@ class PetriNetSelectorWindow(QMainWindow):
         """Find process names that appear on the right-hand side of any definition"""
         right_side_processes = set()
         
-        for process_name, definition in process_definitions.items():
-            # Look for process names (including when they're part of expressions)
-            for other_name in process_definitions.keys():
-                if other_name != process_name:  # Skip self-references
-                    # Use regex to find whole word matches only
-                    pattern = r'\b' + re.escape(other_name) + r'\b'
-                    if re.search(pattern, definition):
-                        right_side_processes.add(other_name)
+        # One tokenization per definition finds every name it mentions,
+        # skipping self-references
+        for references in find_references(process_definitions).values():
+            right_side_processes.update(references)
         
         return right_side_processes
     
@@ -239,6 +234,9 @@ class PetriNetSelectorWindow(QMainWindow):
         if not process_definitions:
             return
         
+        # Find the names each definition mentions once, up front
+        references = find_references(process_definitions)
+        
         # For each process, create a complete expression that includes all
         # processes it references, directly or indirectly
         for process_name in process_definitions:
@@ -247,13 +245,10 @@ class PetriNetSelectorWindow(QMainWindow):
             
             # Follow references recursively
             def add_references(proc):
-                expr = process_definitions[proc]
-                for ref_name in process_definitions:
-                    if ref_name != proc and ref_name not in included_processes:
-                        pattern = r'\b' + re.escape(ref_name) + r'\b'
-                        if re.search(pattern, expr):
-                            included_processes.append(ref_name)
-                            add_references(ref_name)
+                for ref_name in references[proc]:
+                    if ref_name not in included_processes:
+                        included_processes.append(ref_name)
+                        add_references(ref_name)
             
             # Find all processes referenced by this one
             add_references(process_name)
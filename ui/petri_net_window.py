@@ -82,9 +82,12 @@ class PetriNetWindow(QMainWindow):
         view_layout = QVBoxLayout(self.view_widget)
         
         self.scene = DraggableScene(self)
+        # Items are re-added and dragged as a whole, so the BSP index costs more than it saves
+        self.scene.setItemIndexMethod(QGraphicsScene.NoIndex)
         self.view = QGraphicsView(self.scene)
         self.view.setRenderHint(QPainter.Antialiasing)
         self.view.setDragMode(QGraphicsView.NoDrag)
+        self.view.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
         view_layout.addWidget(self.view)
         
         # Add zoom controls
@@ -583,9 +586,7 @@ class PetriNetWindow(QMainWindow):
             if name:
                 try:
                     # If we have a current_net already, update its name
-                    expression = ""
-                    for process_name, definition in self.parser.process_definitions.items():
-                        expression += f"{process_name} = {definition}\n"
+                    expression = self.parser.export_to_process_algebra()
                     
                     # Store the current Petri net
                     net_id = self.parser.store_current_petri_net(name, expression)